@@ -0,0 +1,373 @@
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+from collections import Counter, deque
+from datetime import date, datetime, timedelta, timezone
+from database import db
+from sqlalchemy.exc import DataError, IntegrityError
+
+CLIENT_LENGTH = 100
+AGGREGATE_FIELDS = ("kind", "channel", "success", "user_id", "client")
+
+logger = logging.getLogger(__name__)
+
+
+class AuthEvent(db.Model):
+    __tablename__ = "auth_events"
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False, index=True)
+    channel = db.Column(db.String(10), nullable=True)
+    success = db.Column(db.Boolean, nullable=False)
+    user_id = db.Column(db.Integer, nullable=True)
+    client = db.Column(db.String(CLIENT_LENGTH), nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, index=True)
+
+
+class DatabaseSink:
+    """Writes event batches to the auth_events table."""
+
+    # Errors caused by the rows themselves rather than an unavailable database
+    data_errors = (DataError, IntegrityError)
+
+    def __init__(self, app):
+        self.app = app
+
+    def create_table(self):
+        """
+        Create the auth_events table if it does not exist yet.
+
+        The table is not part of database-service, so its migrations and
+        create_all cannot be relied on to create it.
+        """
+        with self.app.app_context():
+            AuthEvent.__table__.create(db.engine, checkfirst=True)
+
+    def write(self, events):
+        """Insert a batch of events with a single executemany statement."""
+        with self.app.app_context():
+            with db.engine.begin() as connection:
+                connection.execute(AuthEvent.__table__.insert(), events)
+
+    def aggregate_query(self, since, bucket, by, kind=None, success=None):
+        """Build the GROUP BY query behind `aggregate`."""
+        start = (
+            db.func.floor(db.extract("epoch", AuthEvent.created_at) / bucket) * bucket
+        ).label("start")
+        columns = [start]
+        if by:
+            columns.append(getattr(AuthEvent, by).label("key"))
+        query = (
+            db.select(*columns, db.func.count().label("count"))
+            .where(AuthEvent.created_at >= since)
+            .group_by(*(column.name for column in columns))
+        )
+        if kind:
+            query = query.where(AuthEvent.kind == kind)
+        if success is not None:
+            query = query.where(AuthEvent.success == success)
+        return query
+
+    def aggregate(self, since, bucket, by, kind=None, success=None):
+        """Count events per bucket and `by` value with a GROUP BY query."""
+        query = self.aggregate_query(since, bucket, by, kind=kind, success=success)
+        with self.app.app_context(), db.engine.connect() as connection:
+            return {
+                (
+                    datetime.fromtimestamp(int(row.start), timezone.utc),
+                    row.key if by else None,
+                ): row.count
+                for row in connection.execute(query)
+            }
+
+
+class FileSink:
+    """
+    Appends event batches as JSON lines to local files, one file per UTC day.
+
+    For a path of `events.jsonl` events go to `events-2026-01-01.jsonl` and so
+    on, so `aggregate` only reads the days it needs and old days can be
+    archived or deleted by removing their files. Each batch is written with a
+    single O_APPEND write, so batches from several workers sharing the same
+    files do not interleave.
+    """
+
+    data_errors = (TypeError, ValueError)
+
+    def __init__(self, path):
+        self.path = path
+        self.directory = os.path.dirname(path) or "."
+        self.root, self.ext = os.path.splitext(os.path.basename(path))
+        self.pattern = re.compile(
+            rf"{re.escape(self.root)}-(\d{{4}}-\d{{2}}-\d{{2}}){re.escape(self.ext)}"
+        )
+
+    def path_for(self, day):
+        """Return the file holding the events of a UTC day."""
+        return os.path.join(self.directory, f"{self.root}-{day.isoformat()}{self.ext}")
+
+    def paths(self, since=None):
+        """Return the daily files in order, skipping days before `since`."""
+        if not os.path.isdir(self.directory):
+            return []
+        first_day = since.astimezone(timezone.utc).date() if since else date.min
+        return [
+            os.path.join(self.directory, name)
+            for name in sorted(os.listdir(self.directory))
+            if (match := self.pattern.fullmatch(name))
+            and date.fromisoformat(match[1]) >= first_day
+        ]
+
+    def write(self, events):
+        """Append a batch of events with one write call per day."""
+        days = {}
+        for event in events:
+            line = json.dumps({**event, "created_at": event["created_at"].isoformat()})
+            day = event["created_at"].astimezone(timezone.utc).date()
+            days.setdefault(day, []).append(line + "\n")
+        for day, lines in days.items():
+            self.append(self.path_for(day), "".join(lines).encode("utf-8"))
+
+    def append(self, path, data):
+        """Append data to a file, starting a new line after a partial one."""
+        fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            size = os.fstat(fd).st_size
+            if size and os.pread(fd, 1, size - 1) != b"\n":
+                # Partial line left behind by a crash mid-write
+                data = b"\n" + data
+            while data:
+                data = data[os.write(fd, data) :]
+        finally:
+            os.close(fd)
+
+    def read(self, kind=None, since=None):
+        """Yield stored events, optionally filtered by kind and start time."""
+        for path in self.paths(since):
+            with open(path, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        event = json.loads(line)
+                        event["created_at"] = datetime.fromisoformat(
+                            event["created_at"]
+                        )
+                    except (ValueError, KeyError, TypeError):
+                        # Partial line left behind by a crash mid-write
+                        continue
+                    if kind and event["kind"] != kind:
+                        continue
+                    if since and event["created_at"] < since:
+                        continue
+                    yield event
+
+    def aggregate(self, since, bucket, by, kind=None, success=None):
+        """Count events per bucket and `by` value while scanning the file."""
+        counts = Counter()
+        for event in self.read(kind=kind, since=since):
+            if success is not None and event["success"] != success:
+                continue
+            timestamp = int(event["created_at"].timestamp())
+            start = datetime.fromtimestamp(timestamp - timestamp % bucket, timezone.utc)
+            counts[(start, event.get(by) if by else None)] += 1
+        return dict(counts)
+
+
+class EventLog:
+    """
+    Write-behind log for authentication events.
+
+    Events are buffered in memory and flushed by a background thread, either
+    once `batch_size` events are pending or every `interval` seconds. The
+    thread is started by the first `record()` in each process, so it also
+    runs in workers forked after import. With `background=False` no thread
+    is started and the caller is responsible for calling `flush()`. The
+    buffer holds at most `max_buffer` events; anything recorded beyond that
+    is dropped and counted in `dropped`. While the sink is unavailable events
+    stay buffered and flushing backs off for one interval. Events the sink
+    rejects as invalid are counted in `failed`.
+    """
+
+    def __init__(
+        self, sink, batch_size=100, interval=10, max_buffer=10000, background=True
+    ):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_buffer = max_buffer
+        self.dropped = 0
+        self.failed = 0
+        self.buffer = deque()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.flush_lock = threading.Lock()
+        self.start_lock = threading.Lock()
+        self.background = background
+        self.worker = None
+        self.pid = None
+
+    def start(self):
+        """Start the flusher thread if it is not running in this process."""
+        with self.start_lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.worker = threading.Thread(target=self.run, daemon=True)
+            self.worker.start()
+            atexit.register(self.close)
+
+    def close(self):
+        """Stop the flusher thread and flush what is left in the buffer."""
+        self.stopping.set()
+        self.wakeup.set()
+        if self.worker and self.worker.is_alive():
+            self.worker.join()
+        atexit.unregister(self.close)
+        self.flush()
+
+    def record(self, kind, success=True, user_id=None, client=None, channel=None):
+        """Buffer an event without touching the sink."""
+        if self.background and self.pid != os.getpid():
+            self.start()
+        event = {
+            "kind": kind,
+            "channel": channel,
+            "success": success,
+            "user_id": user_id,
+            "client": str(client)[:CLIENT_LENGTH] if client else None,
+            "created_at": datetime.now(timezone.utc),
+        }
+        with self.lock:
+            if len(self.buffer) >= self.max_buffer:
+                self.dropped += 1
+                return False
+            self.buffer.append(event)
+            pending = len(self.buffer)
+        if pending >= self.batch_size:
+            self.wakeup.set()
+        return True
+
+    def flush(self):
+        """
+        Write all buffered events to the sink in batches of `batch_size`.
+
+        Returns False if the sink is unavailable, in which case the failed
+        batch is put back at the front of the buffer.
+        """
+        with self.flush_lock:
+            while True:
+                with self.lock:
+                    batch = [
+                        self.buffer.popleft()
+                        for _ in range(min(self.batch_size, len(self.buffer)))
+                    ]
+                if not batch:
+                    return True
+                try:
+                    self.sink.write(batch)
+                except self.sink.data_errors:
+                    logger.exception(
+                        "Event log batch of %d events rejected, retrying one by one",
+                        len(batch),
+                    )
+                    self.write_each(batch)
+                except Exception:
+                    logger.exception("Event log sink unavailable")
+                    self.requeue(batch)
+                    return False
+
+    def write_each(self, batch):
+        """Write events one at a time so a bad event only loses itself."""
+        failed = 0
+        for event in batch:
+            try:
+                self.sink.write([event])
+            except Exception:
+                failed += 1
+        if failed:
+            with self.lock:
+                self.failed += failed
+            logger.error(
+                "Event log failed to write %d of %d events", failed, len(batch)
+            )
+
+    def requeue(self, batch):
+        """Put a batch back at the front of the buffer, dropping the overflow."""
+        with self.lock:
+            self.buffer.extendleft(reversed(batch))
+            while len(self.buffer) > self.max_buffer:
+                self.buffer.pop()
+                self.dropped += 1
+
+    def run(self):
+        """Flush on size or interval until stopped."""
+        while not self.stopping.is_set():
+            self.wakeup.wait(timeout=self.interval)
+            self.wakeup.clear()
+            if not self.flush():
+                self.stopping.wait(self.interval)
+
+    def stats(self):
+        """Return the buffer size and the number of dropped and failed events."""
+        with self.lock:
+            return {
+                "buffered": len(self.buffer),
+                "dropped": self.dropped,
+                "failed": self.failed,
+            }
+
+    def aggregate(
+        self, kind=None, since=None, bucket=60, by="client", success=None, window=3600
+    ):
+        """
+        Count stored events per time bucket (in seconds) and per value of `by`.
+
+        For example `aggregate("login", bucket=60, by="client")` returns logins
+        per minute per client as {(bucket_start, client): count}. Only events
+        after `since` are counted, which defaults to the last `window` seconds.
+        Naive datetimes are treated as UTC. Events still in the buffer are not
+        included.
+        """
+        if by is not None and by not in AGGREGATE_FIELDS:
+            raise ValueError(f"Cannot aggregate by {by!r}.")
+        if since is None:
+            since = datetime.now(timezone.utc) - timedelta(seconds=window)
+        elif since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return self.sink.aggregate(
+            since=since, bucket=bucket, by=by, kind=kind, success=success
+        )
+
+
+def create_event_log(app):
+    """
+    Create an EventLog configured from the environment.
+
+    Serverless instances such as Vercel freeze background threads between
+    invocations, so there the buffer is flushed at the end of every request.
+    """
+    path = os.getenv("EVENT_LOG_FILE")
+    if path:
+        sink = FileSink(path)
+    else:
+        sink = DatabaseSink(app)
+        sink.create_table()
+    serverless = bool(os.getenv("VERCEL"))
+    event_log = EventLog(
+        sink,
+        batch_size=int(os.getenv("EVENT_LOG_BATCH_SIZE", "100")),
+        interval=float(os.getenv("EVENT_LOG_INTERVAL", "10")),
+        max_buffer=int(os.getenv("EVENT_LOG_MAX_BUFFER", "10000")),
+        background=not serverless,
+    )
+
+    if serverless:
+
+        @app.teardown_request
+        def flush_event_log(exception=None):
+            event_log.flush()
+
+    return event_log
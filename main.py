@@ -11,6 +11,7 @@ from flask import (
     session,
 )
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.security import generate_password_hash, check_password_hash
 from database import (
     AirNomads,
@@ -23,6 +24,7 @@ from database import (
     db,
 )
 from utils import Manager
+from events import create_event_log
 from dotenv import load_dotenv
 import os
 from flask_login import (
@@ -42,6 +44,11 @@ app.config["SECRET_KEY"] = os.getenv("SECRET_KEY")
 app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DB_URI")
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# Number of reverse proxies in front of the app whose X-Forwarded-For is trusted
+trusted_proxies = int(os.getenv("TRUSTED_PROXIES", "0"))
+if trusted_proxies:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=trusted_proxies)
+
 CORS(app, resources={r"/api/*": {"origins": ["https://timonrieger.de"]}})
 
 db.init_app(app)
@@ -63,6 +70,17 @@ class User(UserMixin, UserModel):
 
 
 manager = Manager()
+event_log = create_event_log(app)
+
+
+def log_event(kind, success=True, user_id=None):
+    event_log.record(
+        kind,
+        success=success,
+        user_id=user_id,
+        client=request.remote_addr,
+        channel="web" if request.path.startswith("/app/") else "api",
+    )
 
 
 with app.app_context():
@@ -139,13 +157,17 @@ def login():
 
     user = User.query.filter_by(email=valid_email).first()
     if not user:
+        log_event("login", success=False)
         return jsonify({"message": "No account found!"}), 401
     if not user.confirmed:
+        log_event("login", success=False, user_id=user.id)
         return jsonify({"message": "Please confirm your email address first."}), 401
 
     if check_password_hash(user.password, data["password"]):
+        log_event("login", user_id=user.id)
         return jsonify({"message": f"Login successful, {user.username}!"}), 200
 
+    log_event("login", success=False, user_id=user.id)
     return jsonify({"message": "Invalid credentials!"}), 401
 
 
@@ -153,21 +175,27 @@ def login():
 def verify_apikey():
     token = request.headers.get("Authorization")
     if token is None:
+        log_event("apikey_verify", success=False)
         return {"error": "No authorization header provided."}
     try:
         user_id, _ = token.split(".")
     except Exception:
+        log_event("apikey_verify", success=False)
         return {"error": "Invalid authorization header."}
 
     user = User.query.filter_by(id=user_id).first()
     if not user:
+        log_event("apikey_verify", success=False)
         return jsonify({"message": "No user found!"}), 400
     if not user.confirmed:
+        log_event("apikey_verify", success=False, user_id=user.id)
         return jsonify({"message": "Please confirm your email address first."}), 401
 
     if check_password_hash(user.apikey, token):
+        log_event("apikey_verify", user_id=user.id)
         return jsonify({"message": "Verification successful!", "user_id": user_id}), 200
 
+    log_event("apikey_verify", success=False, user_id=user.id)
     return jsonify({"message": "Invalid credentials!"}), 401
 
 
@@ -224,6 +252,7 @@ def confirm_email_change():
     current_user.email = session["pending_email"]
     session.pop("pending_email", None)
     db.session.commit()
+    log_event("email_change", user_id=current_user.id)
     flash("Your email address has been updated successfully!", "success")
 
     return redirect(f"{request.url_root}/app")
@@ -255,13 +284,16 @@ def post_login():
 
     user = User.query.filter_by(email=valid_email).first()
     if not user:
+        log_event("login", success=False)
         flash("No account found!", "danger")
         return redirect(request.url)
     if not user.confirmed:
+        log_event("login", success=False, user_id=user.id)
         flash("No account found!", "danger")
         return redirect(request.url)
 
     if check_password_hash(user.password, data["password"]):
+        log_event("login", user_id=user.id)
         login_user(user)
         flash(f"Login successful, {user.username}!", "success")
         redirect_to = request.args.get("next")
@@ -270,6 +302,7 @@ def post_login():
             return redirect(redirect_to)
         return redirect(f"{request.url_root}/app")
 
+    log_event("login", success=False, user_id=user.id)
     flash("Invalid credentials!", "danger")
     return redirect(request.url)
 
@@ -304,6 +337,7 @@ def post_password_change():
         data.get("password"), "pbkdf2:sha256", 8
     )
     db.session.commit()
+    log_event("password_change", user_id=current_user.id)
     flash("Password change successful!", "success")
 
     return redirect(f"{request.url_root}/app")
@@ -325,11 +359,13 @@ def post_password_reset():
 
     user = User.query.filter_by(email=valid_email).first()
     if not user:
+        log_event("password_reset", success=False)
         flash("No account found!", "danger")
         return redirect(request.url)
 
     user.token = manager.generate_token(expire=manager.valid_hours * 3600)
     db.session.commit()
+    log_event("password_reset", user_id=user.id)
     mail = manager.create_mail(
         user_mail=valid_email,
         user_id=user.id,
@@ -381,6 +417,7 @@ def post_email_change():
 
     current_user.token = manager.generate_token(expire=manager.valid_hours * 3600)
     db.session.commit()
+    log_event("email_change_request", user_id=current_user.id)
 
     mail = manager.create_mail(
         user_mail=valid_email,
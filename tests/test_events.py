@@ -0,0 +1,330 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import date, datetime, timezone
+from unittest import mock
+
+from flask import Flask
+from sqlalchemy.dialects import postgresql
+
+from events import DatabaseSink, EventLog, FileSink, create_event_log
+
+
+class FakeSink:
+    data_errors = (ValueError,)
+
+    def __init__(self, bad_user_ids=(), down=False):
+        self.batches = []
+        self.attempts = 0
+        self.bad_user_ids = bad_user_ids
+        self.down = down
+
+    def write(self, events):
+        self.attempts += 1
+        if self.down:
+            raise ConnectionError("sink unavailable")
+        if any(event["user_id"] in self.bad_user_ids for event in events):
+            raise ValueError("invalid event")
+        self.batches.append(list(events))
+
+    @property
+    def events(self):
+        return [event for batch in self.batches for event in batch]
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class EventLogTest(unittest.TestCase):
+    def test_flushes_when_batch_size_is_reached(self):
+        sink = FakeSink()
+        event_log = EventLog(sink, batch_size=3, interval=60)
+        self.addCleanup(event_log.close)
+
+        for _ in range(3):
+            event_log.record("login")
+
+        self.assertTrue(wait_for(lambda: sink.batches))
+        self.assertEqual(len(sink.batches[0]), 3)
+
+    def test_flushes_after_interval(self):
+        sink = FakeSink()
+        event_log = EventLog(sink, batch_size=100, interval=0.05)
+        self.addCleanup(event_log.close)
+
+        event_log.record("login")
+
+        self.assertTrue(wait_for(lambda: sink.batches))
+        self.assertEqual(event_log.stats()["buffered"], 0)
+
+    def test_drops_events_when_buffer_is_full(self):
+        event_log = EventLog(FakeSink(), max_buffer=2, background=False)
+
+        self.assertTrue(event_log.record("login"))
+        self.assertTrue(event_log.record("login"))
+        self.assertFalse(event_log.record("login"))
+
+        self.assertEqual(event_log.stats(), {"buffered": 2, "dropped": 1, "failed": 0})
+
+    def test_close_stops_worker_and_flushes(self):
+        sink = FakeSink()
+        event_log = EventLog(sink, batch_size=100, interval=60)
+
+        event_log.record("login")
+        worker = event_log.worker
+        event_log.close()
+
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(len(sink.events), 1)
+
+    def test_truncates_client(self):
+        sink = FakeSink()
+        event_log = EventLog(sink, background=False)
+
+        event_log.record("login", client="x" * 1000)
+        event_log.flush()
+
+        self.assertEqual(len(sink.events[0]["client"]), 100)
+
+    def test_failing_event_only_loses_itself(self):
+        sink = FakeSink(bad_user_ids=(2,))
+        event_log = EventLog(sink, batch_size=10, background=False)
+
+        for user_id in (1, 2, 3):
+            event_log.record("login", user_id=user_id)
+        with self.assertLogs("events", level="ERROR"):
+            event_log.flush()
+
+        self.assertEqual([event["user_id"] for event in sink.events], [1, 3])
+        self.assertEqual(event_log.stats(), {"buffered": 0, "dropped": 0, "failed": 1})
+
+    def test_unavailable_sink_keeps_events_buffered(self):
+        sink = FakeSink(down=True)
+        event_log = EventLog(sink, batch_size=2, background=False)
+
+        for user_id in range(4):
+            event_log.record("login", user_id=user_id)
+
+        with self.assertLogs("events", level="ERROR"):
+            self.assertFalse(event_log.flush())
+        self.assertEqual(sink.attempts, 1)
+        self.assertEqual(event_log.stats(), {"buffered": 4, "dropped": 0, "failed": 0})
+
+        sink.down = False
+        self.assertTrue(event_log.flush())
+        self.assertEqual([event["user_id"] for event in sink.events], [0, 1, 2, 3])
+
+    def test_requeue_drops_overflow(self):
+        sink = FakeSink(down=True)
+        event_log = EventLog(sink, batch_size=2, max_buffer=3, background=False)
+
+        def write(events):
+            # Requests keep recording while the batch is in flight
+            event_log.record("login", user_id=98)
+            event_log.record("login", user_id=99)
+            raise ConnectionError("sink unavailable")
+
+        sink.write = write
+        for user_id in range(3):
+            event_log.record("login", user_id=user_id)
+        with self.assertLogs("events", level="ERROR"):
+            event_log.flush()
+
+        self.assertEqual(event_log.stats(), {"buffered": 3, "dropped": 2, "failed": 0})
+        self.assertEqual([event["user_id"] for event in event_log.buffer], [0, 1, 2])
+
+
+class AggregateTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.sink = FileSink(f"{directory.name}/events.jsonl")
+        self.event_log = EventLog(self.sink, background=False)
+
+    def write(self, kind, client, minute, second, success=True):
+        self.sink.write(
+            [
+                {
+                    "kind": kind,
+                    "channel": "api",
+                    "success": success,
+                    "user_id": None,
+                    "client": client,
+                    "created_at": datetime(
+                        2026, 1, 1, 12, minute, second, tzinfo=timezone.utc
+                    ),
+                }
+            ]
+        )
+
+    def test_counts_per_minute_per_client(self):
+        self.write("login", "1.1.1.1", 0, 5)
+        self.write("login", "1.1.1.1", 0, 55)
+        self.write("login", "2.2.2.2", 0, 30)
+        self.write("login", "1.1.1.1", 1, 0)
+        self.write("apikey_verify", "1.1.1.1", 0, 10)
+
+        counts = self.event_log.aggregate(
+            "login", since=datetime(2026, 1, 1, 12), bucket=60, by="client"
+        )
+
+        minute = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+        next_minute = datetime(2026, 1, 1, 12, 1, tzinfo=timezone.utc)
+        self.assertEqual(
+            counts,
+            {
+                (minute, "1.1.1.1"): 2,
+                (minute, "2.2.2.2"): 1,
+                (next_minute, "1.1.1.1"): 1,
+            },
+        )
+
+    def test_filters_by_since_and_success(self):
+        self.write("login", "1.1.1.1", 0, 5, success=False)
+        self.write("login", "1.1.1.1", 5, 0, success=False)
+        self.write("login", "1.1.1.1", 5, 1)
+
+        counts = self.event_log.aggregate(
+            "login",
+            since=datetime(2026, 1, 1, 12, 1, tzinfo=timezone.utc),
+            bucket=3600,
+            by=None,
+            success=False,
+        )
+
+        self.assertEqual(
+            counts, {(datetime(2026, 1, 1, 12, tzinfo=timezone.utc), None): 1}
+        )
+
+    def test_recovers_from_partial_line(self):
+        with open(self.sink.path_for(date(2026, 1, 1)), "a") as file:
+            file.write('{"kind": "login", "created_at": "2026-01')
+        self.write("login", "1.1.1.1", 0, 5)
+
+        counts = self.event_log.aggregate("login", since=datetime(2026, 1, 1), by=None)
+
+        self.assertEqual(
+            counts, {(datetime(2026, 1, 1, 12, tzinfo=timezone.utc), None): 1}
+        )
+
+    def test_rotates_files_by_day(self):
+        self.write("login", "1.1.1.1", 0, 5)
+        self.sink.write(
+            [
+                {
+                    "kind": "login",
+                    "channel": "api",
+                    "success": True,
+                    "user_id": None,
+                    "client": "1.1.1.1",
+                    "created_at": datetime(2026, 1, 2, 8, tzinfo=timezone.utc),
+                }
+            ]
+        )
+
+        self.assertEqual(
+            self.sink.paths(),
+            [
+                self.sink.path_for(date(2026, 1, 1)),
+                self.sink.path_for(date(2026, 1, 2)),
+            ],
+        )
+        self.assertEqual(
+            self.sink.paths(since=datetime(2026, 1, 2, tzinfo=timezone.utc)),
+            [self.sink.path_for(date(2026, 1, 2))],
+        )
+        self.assertEqual(
+            self.event_log.aggregate(
+                "login", since=datetime(2026, 1, 1), bucket=86400, by=None
+            ),
+            {
+                (datetime(2026, 1, 1, tzinfo=timezone.utc), None): 1,
+                (datetime(2026, 1, 2, tzinfo=timezone.utc), None): 1,
+            },
+        )
+
+    def test_rejects_unknown_field(self):
+        with self.assertRaises(ValueError):
+            self.event_log.aggregate(by="password")
+
+
+class CreateEventLogTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = f"{directory.name}/events.jsonl"
+        self.app = Flask(__name__)
+
+    def create(self, **env):
+        with mock.patch.dict("os.environ", {"EVENT_LOG_FILE": self.path, **env}):
+            event_log = create_event_log(self.app)
+        self.addCleanup(event_log.close)
+
+        @self.app.route("/")
+        def index():
+            event_log.record("login")
+            return ""
+
+        return event_log
+
+    def test_flushes_after_each_request_on_vercel(self):
+        event_log = self.create(VERCEL="1")
+
+        self.app.test_client().get("/")
+
+        self.assertFalse(event_log.background)
+        self.assertIsNone(event_log.worker)
+        self.assertEqual(sum(event_log.aggregate("login", by=None).values()), 1)
+
+    def test_buffers_in_background_elsewhere(self):
+        with mock.patch.dict("os.environ"):
+            os.environ.pop("VERCEL", None)
+            event_log = self.create()
+
+        self.app.test_client().get("/")
+
+        self.assertTrue(event_log.worker.is_alive())
+        self.assertEqual(event_log.stats()["buffered"], 1)
+
+
+class DatabaseSinkTest(unittest.TestCase):
+    def compile(self, query):
+        return " ".join(str(query.compile(dialect=postgresql.dialect())).split())
+
+    def test_aggregate_query_groups_by_bucket_and_field(self):
+        query = DatabaseSink(app=None).aggregate_query(
+            since=datetime(2026, 1, 1, tzinfo=timezone.utc),
+            bucket=60,
+            by="client",
+            kind="login",
+            success=False,
+        )
+
+        sql = self.compile(query)
+
+        self.assertIn("floor(EXTRACT(epoch FROM auth_events.created_at) /", sql)
+        self.assertIn("auth_events.client AS key", sql)
+        self.assertIn("GROUP BY start, key", sql)
+        self.assertIn("auth_events.kind = %(kind_1)s", sql)
+        self.assertIn("auth_events.success = false", sql)
+
+    def test_aggregate_query_without_field(self):
+        query = DatabaseSink(app=None).aggregate_query(
+            since=datetime(2026, 1, 1, tzinfo=timezone.utc), bucket=60, by=None
+        )
+
+        sql = self.compile(query)
+
+        self.assertNotIn("key", sql)
+        self.assertIn("GROUP BY start", sql)
+
+
+if __name__ == "__main__":
+    unittest.main()
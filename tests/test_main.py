@@ -0,0 +1,141 @@
+import os
+import unittest
+from unittest import mock
+
+from werkzeug.security import generate_password_hash
+
+os.environ["DB_URI"] = "sqlite://"
+os.environ["SECRET_KEY"] = "test"
+os.environ["TRUSTED_PROXIES"] = "1"
+os.environ.pop("EVENT_LOG_FILE", None)
+os.environ.pop("VERCEL", None)
+
+import main  # noqa: E402
+from events import EventLog  # noqa: E402
+from tests.test_events import FakeSink  # noqa: E402
+
+
+class LogEventTest(unittest.TestCase):
+    def setUp(self):
+        self.sink = FakeSink()
+        self.event_log = EventLog(self.sink, background=False)
+        patcher = mock.patch.object(main, "event_log", self.event_log)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.client = main.app.test_client()
+        with main.app.app_context():
+            user = main.User(
+                email="alice@example.com",
+                password=generate_password_hash("secret", "pbkdf2:sha256", 8),
+                username="alice",
+                confirmed=1,
+            )
+            main.db.session.add(user)
+            main.db.session.commit()
+            self.user_id = user.id
+        self.addCleanup(self.delete_user)
+
+    def delete_user(self):
+        with main.app.app_context():
+            main.db.session.delete(main.db.session.get(main.User, self.user_id))
+            main.db.session.commit()
+
+    def event(self):
+        self.event_log.flush()
+        self.assertEqual(len(self.sink.events), 1)
+        event = self.sink.events[0]
+        return {key: event[key] for key in ("kind", "channel", "success", "user_id")}
+
+    def test_api_login(self):
+        self.client.post(
+            "/api/login", json={"email": "alice@example.com", "password": "secret"}
+        )
+
+        self.assertEqual(
+            self.event(),
+            {
+                "kind": "login",
+                "channel": "api",
+                "success": True,
+                "user_id": self.user_id,
+            },
+        )
+
+    def test_api_login_unknown_account(self):
+        self.client.post(
+            "/api/login", json={"email": "bob@example.com", "password": "secret"}
+        )
+
+        self.assertEqual(
+            self.event(),
+            {"kind": "login", "channel": "api", "success": False, "user_id": None},
+        )
+
+    def test_web_login_wrong_password(self):
+        self.client.post(
+            "/app/login", data={"email": "alice@example.com", "password": "wrong"}
+        )
+
+        self.assertEqual(
+            self.event(),
+            {
+                "kind": "login",
+                "channel": "web",
+                "success": False,
+                "user_id": self.user_id,
+            },
+        )
+
+    def test_apikey_without_header(self):
+        self.client.get("/api/apikey/verify")
+
+        self.assertEqual(
+            self.event(),
+            {
+                "kind": "apikey_verify",
+                "channel": "api",
+                "success": False,
+                "user_id": None,
+            },
+        )
+
+    def test_apikey_with_malformed_header(self):
+        self.client.get("/api/apikey/verify", headers={"Authorization": "garbage"})
+
+        self.assertFalse(self.event()["success"])
+
+    def test_password_reset_unknown_email(self):
+        self.client.post("/app/password/reset", data={"email": "bob@example.com"})
+
+        self.assertEqual(
+            self.event(),
+            {
+                "kind": "password_reset",
+                "channel": "web",
+                "success": False,
+                "user_id": None,
+            },
+        )
+
+    def test_client_is_remote_address(self):
+        self.client.get(
+            "/api/apikey/verify", environ_base={"REMOTE_ADDR": "198.51.100.7"}
+        )
+
+        self.event_log.flush()
+        self.assertEqual(self.sink.events[0]["client"], "198.51.100.7")
+
+    def test_client_from_trusted_proxy_only(self):
+        self.client.get(
+            "/api/apikey/verify",
+            headers={"X-Forwarded-For": "6.6.6.6, 203.0.113.9"},
+            environ_base={"REMOTE_ADDR": "10.0.0.1"},
+        )
+
+        self.event_log.flush()
+        self.assertEqual(self.sink.events[0]["client"], "203.0.113.9")
+
+
+if __name__ == "__main__":
+    unittest.main()